@@ -1,8 +1,12 @@
 # app.py
 import streamlit as st
-import PyPDF2
-import io
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import fitz
+import os
 import re
+import shutil
+import tempfile
+import threading
 import time
 from datetime import datetime
 import base64
@@ -10,71 +14,189 @@ import pandas as pd
 from transformers import pipeline
 import torch
 
-# Initialize NLP classifier
 try:
-    classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-except:
-    classifier = None
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from optimum.pipelines import pipeline as ort_pipeline
+    from transformers import AutoTokenizer
+except ImportError:
+    ORTModelForSequenceClassification = None
+
+CLASSIFIER_MODEL = "MoritzLaurer/DeBERTa-v3-base-mnli-fever-anli"
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_cache")
+
+def _load_onnx_classifier():
+    """Build a CPU zero-shot pipeline on ONNX Runtime, exporting the model once."""
+    model_dir = os.path.join(ONNX_CACHE_DIR, CLASSIFIER_MODEL.replace("/", "--"))
+    if os.path.isfile(os.path.join(model_dir, "model.onnx")):
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_dir, provider="CPUExecutionProvider"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    else:
+        model = ORTModelForSequenceClassification.from_pretrained(
+            CLASSIFIER_MODEL, export=True, provider="CPUExecutionProvider"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(CLASSIFIER_MODEL)
+        # Keep the exported graph on disk so later startups skip the export.
+        # Save to a temporary directory and rename it into place so an
+        # interrupted save never leaves a half-written cache behind.
+        tmp_dir = None
+        try:
+            os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=ONNX_CACHE_DIR)
+            model.save_pretrained(tmp_dir)
+            tokenizer.save_pretrained(tmp_dir)
+            shutil.rmtree(model_dir, ignore_errors=True)
+            os.replace(tmp_dir, model_dir)
+        except OSError:
+            # An unwritable cache only costs a re-export on the next start
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+    return ort_pipeline("zero-shot-classification", model=model, tokenizer=tokenizer,
+                        accelerator="ort", batch_size=16)
+
+def _load_torch_classifier():
+    """Build a zero-shot pipeline on PyTorch, tuned for the available device."""
+    classifier = pipeline(
+        "zero-shot-classification",
+        model=CLASSIFIER_MODEL,
+        device=0 if torch.cuda.is_available() else -1,
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+        batch_size=16
+    )
+    if not torch.cuda.is_available():
+        # Dynamic INT8 quantization of the Linear layers speeds up CPU inference
+        classifier.model = torch.quantization.quantize_dynamic(
+            classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return classifier
+
+# Initialize NLP classifier once per process; Streamlit reruns reuse it
+@st.cache_resource(show_spinner=False)
+def get_classifier():
+    try:
+        # ONNX Runtime is the fastest CPU backend; fall back to PyTorch if it
+        # is not installed or the export/load fails
+        classifier = None
+        if ORTModelForSequenceClassification is not None and not torch.cuda.is_available():
+            try:
+                classifier = _load_onnx_classifier()
+            except Exception:
+                classifier = None
+        if classifier is None:
+            classifier = _load_torch_classifier()
+        # Cap sequence length; subject signal sits in the opening tokens
+        classifier.tokenizer.model_max_length = 128
+        return classifier
+    except:
+        return None
 
 # Categories for classification
 CATEGORIES = ["Mathematics", "Physics", "Chemistry"]
 
-def is_question(text):
-    """Determine if text is likely a question (not solution/answer key)."""
-    text = text.lower().strip()
-    
-    # Skip empty or very short text
-    if len(text) < 20:
-        return False
-        
+# Characters of question text sent to the zero-shot classifier
+CLASSIFIER_MAX_CHARS = 400
+
+# Number of uploaded PDFs whose preview and analysis stay cached
+PDF_CACHE_ENTRIES = 8
+
+# Subject-discriminative keywords for the cheap pre-classifier. Terms shared
+# between subjects (range, series, power, current, entropy, moles, molecules,
+# resonance, the "nearest integer" answer boilerplate, ...) are left out so
+# that only unambiguous questions skip the NLP model.
+SUBJECT_KEYWORDS = {
+    "Mathematics": frozenset([
+        'integral', 'integrate', 'integrand', 'derivative', 'differentiate',
+        'dy/dx', 'matrix', 'matrices', 'determinant', 'polynomial', 'quadratic',
+        'parabola', 'ellipse', 'hyperbola', 'eccentricity', 'locus', 'logarithm',
+        'probability', 'permutation', 'permutations', 'combinations', 'binomial',
+        'arithmetic progression', 'geometric progression', 'complex number',
+        'differentiable', 'area bounded', 'real roots', 'real number',
+        'natural number', 'trigonometric', 'asymptote', 'bijective', 'injective',
+        'surjective', 'tangent to the curve',
+    ]),
+    "Physics": frozenset([
+        'velocity', 'acceleration', 'friction', 'projectile', 'kinetic energy',
+        'work done', 'torque', 'moment of inertia', 'pendulum', 'oscillation',
+        'lens', 'refraction', 'interference', 'diffraction', 'resistor',
+        'capacitor', 'capacitance', 'inductor', 'inductance', 'voltage',
+        'electric field', 'magnetic field', 'coulomb', 'photoelectric',
+        'heat engine', 'spring', 'pulley', 'mass m', 'galvanometer', 'ammeter',
+        'voltmeter', 'focal length', 'young',
+    ]),
+    "Chemistry": frozenset([
+        'molarity', 'molality', 'orbitals', 'hybridisation', 'hybridization',
+        'cation', 'anion', 'redox', 'oxidation state', 'electrolysis', 'acidic',
+        'buffer', 'equilibrium constant', 'enthalpy', 'catalyst', 'periodic table',
+        'covalent', 'ionic', 'alkane', 'alkene', 'alkyne', 'benzene', 'aromatic',
+        'isomer', 'isomers', 'iupac', 'aldehyde', 'ketone', 'ester', 'alcohol',
+        'polymer', 'precipitate', 'titration', 'ligand', 'electronegativity',
+        'stoichiometric',
+    ]),
+}
+
+# Paragraph filters used by _question_mask, built once at import time
+_ANSWER_KEY_RE = re.compile(r'^\s*\d+\.?\s*[a-d]\s*$', re.IGNORECASE)
+_QUESTION_NUMBER_RE = re.compile(r'^\s*(Q|Question)?\s*\d+[.)]', re.IGNORECASE)
+
+_SOLUTION_INDICATORS = ['solution:', 'answer key', 'explanation:', 'answers:',
+                        'correct option', 'key answers', 'sol.', 'ans.']
+_QUESTION_INDICATORS = ['what', 'which', 'how many', 'calculate', 'determine',
+                        'find', 'prove', 'show that', 'ratio of', 'value of']
+_SOLUTION_RE = re.compile('|'.join(map(re.escape, _SOLUTION_INDICATORS)))
+_QUESTION_RE = re.compile('|'.join(map(re.escape, _QUESTION_INDICATORS)))
+
+def _question_mask(paragraphs):
+    """Determine which paragraphs are likely questions (not solutions/answer keys)."""
+    text = paragraphs.str.lower().str.strip()
     # Skip sections that look like solutions/answers
-    solution_indicators = ['solution:', 'answer key', 'explanation:', 'answers:', 
-                          'correct option', 'key answers', 'sol.', 'ans.']
-    if any(indicator in text for indicator in solution_indicators):
-        return False
-        
+    has_solution = text.str.contains(_SOLUTION_RE)
     # Skip lines that are just numbers or letters (likely answer keys)
-    if re.match(r'^\s*\d+\.?\s*[a-d]\s*$', text, re.IGNORECASE):
-        return False
-        
-    # Look for question patterns
-    question_indicators = ['what', 'which', 'how many', 'calculate', 'determine', 
-                          'find', 'prove', 'show that', 'ratio of', 'value of']
-    if any(indicator in text for indicator in question_indicators):
-        return True
-        
-    # Look for question numbers
-    if re.match(r'^\s*(Q|Question)?\s*\d+[.)]', text[:20], re.IGNORECASE):
-        return True
-        
-    return False
+    is_answer_key = text.str.match(_ANSWER_KEY_RE)
+    # Look for question patterns or question numbers
+    has_question = text.str.contains(_QUESTION_RE)
+    has_number = text.str[:20].str.match(_QUESTION_NUMBER_RE)
+    # Skip empty or very short text
+    return ((text.str.len() >= 20) & ~has_solution & ~is_answer_key
+            & (has_question | has_number))
+
+def _finalize_question(question):
+    """Join the collected text parts of a question into its text."""
+    question['text'] = "\n".join(question.pop('text_parts'))
+    return question
 
-def extract_questions_from_pdf(pdf_file):
-    """Extract text from PDF and split into questions."""
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
+def extract_questions_from_pdf(pdf_bytes):
+    """Extract text from PDF bytes and split into questions."""
+    # Pages are extracted serially: worker processes started under Streamlit
+    # re-run this whole script on import, which costs far more than parsing
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    text = "\n".join(page.get_text("text") for page in doc)
+    doc.close()
     
     # Split text into paragraphs/lines
     paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
     
+    # Classify all paragraphs up front with vectorized string ops
+    series = pd.Series(paragraphs, dtype="object")
+    question_mask = _question_mask(series).tolist()
+    option_text = series.str.extract(r'^\s*\(([a-d])\)\s*(.*)$', flags=re.IGNORECASE)[1].tolist()
+    
     questions = []
     current_question = None
     question_number = 1
     
-    for para in paragraphs:
+    for para, para_is_question, option in zip(paragraphs, question_mask, option_text):
         # Handle paragraph that starts a new question
-        if is_question(para):
+        if para_is_question:
             # If we have a current question being built, save it first
             if current_question:
-                questions.append(current_question)
+                questions.append(_finalize_question(current_question))
                 question_number += 1
                 
             # Start new question
             current_question = {
                 "number": str(question_number),
-                "text": para,
+                "text_parts": [para],
                 "subject": None,
                 "options": [],
                 "answer": None,
@@ -83,28 +205,54 @@ def extract_questions_from_pdf(pdf_file):
         elif current_question:
             # This might be options or continuation of current question
             # Check if it looks like options (A), (B) etc.
-            option_match = re.match(r'^\s*\(([a-d])\)\s*(.*)$', para, re.IGNORECASE)
-            if option_match:
-                current_question['options'].append(option_match.group(2))
+            if isinstance(option, str):
+                current_question['options'].append(option)
             else:
                 # Otherwise append to question text
-                current_question['text'] += "\n" + para
+                current_question['text_parts'].append(para)
     
     # Add the last question if there is one
     if current_question:
-        questions.append(current_question)
+        questions.append(_finalize_question(current_question))
     
     return questions
 
-def classify_question(question_text):
-    """Classify question into subject using NLP."""
-    if classifier:
-        result = classifier(question_text, candidate_labels=CATEGORIES)
-        return result['labels'][0]
+def classify_questions(texts):
+    """Classify a batch of question texts into subjects using NLP."""
+    classifier = get_classifier()
+    if not classifier or not texts:
+        return [None] * len(texts)
+    # Subject signal sits in the opening words; shorter inputs cut attention cost
+    texts = [text[:CLASSIFIER_MAX_CHARS] for text in texts]
+    # Repeated texts (instructions, shared stems) only need one forward pass
+    unique_texts = list(dict.fromkeys(texts))
+    
+    # A single call with the whole list lets the pipeline batch the entailment pairs
+    with torch.inference_mode():
+        results = classifier(unique_texts, candidate_labels=CATEGORIES, batch_size=16)
+    if isinstance(results, dict):
+        results = [results]
+    labels = {text: result['labels'][0] for text, result in zip(unique_texts, results)}
+    return [labels[text] for text in texts]
+
+def cheap_classify(text):
+    """Classify a question by subject keywords, or None if not confident."""
+    lower = text.lower()
+    words = set(re.findall(r"[a-z][a-z/\-]*", lower))
+    counts = {
+        subject: sum(1 for kw in keywords if (kw in lower if ' ' in kw else kw in words))
+        for subject, keywords in SUBJECT_KEYWORDS.items()
+    }
+    best = max(counts, key=counts.get)
+    runner_up = sorted(counts.values())[-2]
+    if counts[best] >= 2 and counts[best] > runner_up:
+        return best
     return None
 
-def create_test_interface(questions):
+def create_test_interface(question_data, pdf_id):
     """Create the interactive test interface."""
+    numbers, texts, options, subject_index = question_data
+    
     st.markdown("""
     <style>
         .subject-tab {
@@ -125,25 +273,6 @@ def create_test_interface(questions):
         .question-card:hover {
             box-shadow: 0 4px 6px rgba(0,0,0,0.1);
         }
-        .option-selected {
-            background-color: #3b82f6 !important;
-            color: white !important;
-            border-color: #3b82f6 !important;
-        }
-        .option-btn {
-            display: block;
-            width: 100%;
-            text-align: left;
-            margin-bottom: 8px;
-            padding: 8px 12px;
-            border-radius: 4px;
-            background-color: white;
-            border: 1px solid #e2e8f0;
-            cursor: pointer;
-        }
-        .option-btn:hover {
-            background-color: #f8fafc;
-        }
         .timer {
             font-family: monospace;
             font-size: 24px;
@@ -169,11 +298,14 @@ def create_test_interface(questions):
     if 'current_subject' not in st.session_state:
         st.session_state.current_subject = "All Questions"
     
-    if 'answers' not in st.session_state:
-        st.session_state.answers = {q['number']: None for q in questions}
-    
-    if 'marked_questions' not in st.session_state:
+    # Answers, marks and position are per PDF; start fresh when a new one is uploaded
+    if st.session_state.get('pdf_id') != pdf_id:
+        st.session_state.pdf_id = pdf_id
+        st.session_state.answers = {idx: None for idx in range(len(texts))}
         st.session_state.marked_questions = set()
+        st.session_state.current_question = 0
+        for key in [k for k in st.session_state if str(k).startswith("opt_")]:
+            del st.session_state[key]
     
     # Header with timer
     col1, col2 = st.columns([3, 1])
@@ -191,11 +323,11 @@ def create_test_interface(questions):
     
     # Filter questions by subject
     if st.session_state.current_subject != "All Questions":
-        filtered_questions = [q for q in questions if q.get('subject') == st.session_state.current_subject]
+        filtered_indices = subject_index[st.session_state.current_subject]
     else:
-        filtered_questions = questions
+        filtered_indices = range(len(texts))
     
-    if not questions:
+    if not texts:
         st.warning("No questions were found in the PDF. Please try a different file.")
         return
     
@@ -207,58 +339,48 @@ def create_test_interface(questions):
         st.caption("Green: Answered, Yellow: Marked, Red: Unanswered")
         
         palette_cols = 5
-        rows = (len(questions) + palette_cols - 1) // palette_cols
-        for row in range(rows):
+        answers = st.session_state.answers
+        marked = st.session_state.marked_questions
+        # One set of columns per row keeps buttons aligned even when labels
+        # wrap differently, and keeps row order when Streamlit stacks columns
+        for row_start in range(0, len(filtered_indices), palette_cols):
             cols = st.columns(palette_cols)
-            for i in range(palette_cols):
-                idx = row * palette_cols + i
-                if idx < len(questions):
-                    q_num = questions[idx]['number']
-                    status = "🟢" if st.session_state.answers.get(q_num) else "🔴"
-                    if q_num in st.session_state.marked_questions:
-                        status = "🟡"
-                    if cols[i].button(f"{status} {q_num}", key=f"palette_{q_num}"):
-                        st.session_state.current_question = idx
+            for col, idx in zip(cols, filtered_indices[row_start:row_start + palette_cols]):
+                status = "🟢" if answers.get(idx) is not None else "🔴"
+                if idx in marked:
+                    status = "🟡"
+                if col.button(f"{status} {numbers[idx]}", key=f"palette_{idx}"):
+                    st.session_state.current_question = idx
     
     with col2:
-        if 'current_question' not in st.session_state:
-            st.session_state.current_question = 0
+        current = st.session_state.current_question
         
-        current_q = questions[st.session_state.current_question]
-        
-        st.subheader(f"Question {current_q['number']}")
-        st.markdown(f"<div style='margin-bottom: 20px;'>{current_q['text']}</div>", unsafe_allow_html=True)
+        st.subheader(f"Question {numbers[current]}")
+        st.markdown(f"<div style='margin-bottom: 20px;'>{texts[current]}</div>", unsafe_allow_html=True)
         
         # Display options if available
-        if current_q.get('options'):
+        if options[current]:
             st.write("**Options:**")
-            for idx, option in enumerate(current_q['options']):
-                is_selected = st.session_state.answers.get(current_q['number']) == idx
-                btn_class = "option-selected" if is_selected else ""
-                option_html = f"""
-                <button class="option-btn {btn_class}" 
-                        onclick="parent.document.getElementById('select-option-{idx}').click()">
-                    {chr(65 + idx)}. {option}
-                </button>
-                """
-                st.markdown(option_html, unsafe_allow_html=True)
-                
-                if st.button(f"Select Option {chr(65 + idx)}", 
-                           key=f"select-option-{idx}", 
-                           on_click=select_option, 
-                           args=(current_q['number'], idx),
-                           visible=False):
-                    pass
+            st.radio(
+                "Options",
+                options=range(len(options[current])),
+                format_func=lambda idx: f"{chr(65 + idx)}. {options[current][idx]}",
+                index=st.session_state.answers.get(current),
+                key=f"opt_{current}",
+                on_change=select_option,
+                args=(current,),
+                label_visibility="collapsed"
+            )
         
         # Mark question button
         col1, col2, col3 = st.columns([2, 1, 1])
-        is_marked = current_q['number'] in st.session_state.marked_questions
+        is_marked = current in st.session_state.marked_questions
         mark_label = "✅ Unmark Question" if is_marked else "🔖 Mark for Review"
         if col1.button(mark_label):
             if is_marked:
-                st.session_state.marked_questions.remove(current_q['number'])
+                st.session_state.marked_questions.remove(current)
             else:
-                st.session_state.marked_questions.add(current_q['number'])
+                st.session_state.marked_questions.add(current)
             st.experimental_rerun()
         
         # Navigation buttons
@@ -266,14 +388,60 @@ def create_test_interface(questions):
             st.session_state.current_question -= 1
             st.experimental_rerun()
         
-        if col3.button("Next ⏭") and st.session_state.current_question < len(questions)-1:
+        if col3.button("Next ⏭") and st.session_state.current_question < len(texts)-1:
             st.session_state.current_question += 1
             st.experimental_rerun()
 
-def select_option(question_num, option_idx):
+def select_option(question_idx):
     """Callback for when an option is selected."""
-    st.session_state.answers[question_num] = option_idx
-    st.experimental_rerun()
+    st.session_state.answers[question_idx] = st.session_state[f"opt_{question_idx}"]
+
+def build_question_arrays(questions):
+    """Split question dicts into parallel arrays plus a subject -> indices map."""
+    numbers = [q['number'] for q in questions]
+    texts = [q['text'] for q in questions]
+    options = [q['options'] for q in questions]
+    subject_index = {c: [i for i, q in enumerate(questions) if q['subject'] == c] for c in CATEGORIES}
+    return numbers, texts, options, subject_index
+
+@st.cache_data(max_entries=PDF_CACHE_ENTRIES)
+def pdf_preview_html(pdf_bytes):
+    """Build the embedded PDF preview markup (cached so reruns skip the base64 pass)."""
+    base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
+    return f'<embed src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600" type="application/pdf">'
+
+@st.cache_data(max_entries=PDF_CACHE_ENTRIES, show_spinner=False)
+def analyze_pdf(pdf_bytes):
+    """Extract and classify the questions in a PDF (cached on its contents)."""
+    # Load the classifier in the background while the PDF is being parsed;
+    # classify_questions below blocks on the same cached resource
+    warmup = threading.Thread(target=get_classifier, daemon=True)
+    add_script_run_ctx(warmup, get_script_run_ctx())
+    warmup.start()
+    
+    questions = extract_questions_from_pdf(pdf_bytes)
+    
+    # Resolve unambiguous questions by keyword; only the rest need the model
+    unresolved = []
+    for question in questions:
+        question['subject'] = cheap_classify(question['text'])
+        if question['subject'] is None:
+            unresolved.append(question)
+        
+        # Add mock options if none found
+        if not question.get('options'):
+            question['options'] = [
+                f"Option A for question {question['number']}",
+                f"Option B for question {question['number']}",
+                f"Option C for question {question['number']}",
+                f"Option D for question {question['number']}"
+            ]
+    
+    subjects = classify_questions([q['text'] for q in unresolved])
+    for question, subject in zip(unresolved, subjects):
+        question['subject'] = subject
+    
+    return build_question_arrays(questions)
 
 def main():
     st.set_page_config(page_title="JEE Question Analyzer", layout="wide")
@@ -309,32 +477,20 @@ def main():
         uploaded_file = st.file_uploader("Choose a PDF file", type="pdf", label_visibility="hidden")
     
     if uploaded_file is not None:
+        pdf_bytes = uploaded_file.getvalue()
+        pdf_id = uploaded_file.file_id
+        
         # Display PDF preview
         st.subheader("PDF Preview")
         with st.expander("View Uploaded PDF"):
-            base64_pdf = base64.b64encode(uploaded_file.read()).decode('utf-8')
-            pdf_display = f'<embed src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600" type="application/pdf">'
-            st.markdown(pdf_display, unsafe_allow_html=True)
-            uploaded_file.seek(0)  # Reset file pointer
+            st.markdown(pdf_preview_html(pdf_bytes), unsafe_allow_html=True)
         
         # Process PDF and classify questions
         with st.spinner("Analyzing questions..."):
-            questions = extract_questions_from_pdf(uploaded_file)
-            
-            for question in questions:
-                question['subject'] = classify_question(question['text'])
-                
-                # Add mock options if none found
-                if not question.get('options'):
-                    question['options'] = [
-                        f"Option A for question {question['number']}",
-                        f"Option B for question {question['number']}",
-                        f"Option C for question {question['number']}",
-                        f"Option D for question {question['number']}"
-                    ]
+            question_data = analyze_pdf(pdf_bytes)
         
         # Start test interface
-        create_test_interface(questions)
+        create_test_interface(question_data, pdf_id)
 
 if __name__ == "__main__":
     main()